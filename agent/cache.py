@@ -0,0 +1,61 @@
+"""
+cache.py — Content-hash memoization for the dataset profile & cleaning plan
+
+The same CSV is often uploaded again (iterating on settings, re-clicking Run),
+and app.py writes every upload to a fresh temp file — so entries are keyed by
+a SHA-256 of the file *contents*, never its path or mtime. Stored on disk
+(when `diskcache` is installed) for 7 days, otherwise kept in memory.
+"""
+
+import hashlib
+from pathlib import Path
+from typing import Any, Optional
+
+try:
+    import diskcache
+except ImportError:  # persistence is optional — fall back to memory only
+    diskcache = None
+
+CACHE_DIR = Path.home() / ".dataclean_ai" / "profile_cache"
+TTL = 7 * 24 * 3600          # seconds
+
+# Bump when inspect_dataset's output format changes, so stale
+# profiles from an older version are never served.
+CACHE_VERSION = 2
+
+_store = diskcache.Cache(str(CACHE_DIR)) if diskcache is not None else {}
+stats = {"hits": 0, "misses": 0}
+
+
+def file_sha256(path: str) -> str:
+    """Hash a file in 1 MiB blocks so large CSVs never sit in memory whole."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def text_sha256(*parts: str) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")   # separator — ("ab", "c") and ("a", "bc") differ
+    return digest.hexdigest()
+
+
+def make_key(kind: str, content_hash: str) -> str:
+    return f"{kind}:v{CACHE_VERSION}:{content_hash}"
+
+
+def lookup(key: str) -> Optional[Any]:
+    value = _store.get(key)
+    stats["hits" if value is not None else "misses"] += 1
+    return value
+
+
+def store(key: str, value: Any, ttl: int = TTL) -> None:
+    if diskcache is not None:
+        _store.set(key, value, expire=ttl)
+    else:
+        _store[key] = value
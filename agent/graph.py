@@ -2,21 +2,34 @@
 graph.py — LangGraph wiring for the Data Cleaning Agent
 
 Flow:
-  inspect → plan → generate_code → execute_code
-                                        │
-                        ┌───────────────┴───────────────┐
-                        │ error                          │ success
-                        ▼                               ▼
-                    debug_code                feature_engineering
-                        │                               │
-                        └──────► execute_code           END
+            ┌──► plan ────────────────┐
+  inspect ──┤                         ├──► generate_code → execute_code
+            └──► feature_eng_preview ─┘                        │
+                        ┌──────────────────────────────────────┴───────┐
+                        │ error                                          │ success
+                        ▼                                               ▼
+                    debug_code                              feature_eng_refine
+                        │                                               │
+                        └──────► execute_code                           END
                                   (up to 3 retries)
 
+`plan` and `feature_eng_preview` both read only `data_profile`, so they fan
+out from `inspect` and LangGraph runs them in the same superstep — their
+two LLM calls overlap instead of running back to back.
+
+LLM-backed nodes are `async def` (awaiting `acall_llm`), so run the graph
+with `graph.ainvoke` / `graph.astream`. The CPU-bound `inspect` and
+`execute_code` nodes stay sync; LangGraph runs them in a worker thread.
+
+Simple mode (`build_graph(simple_mode=True)`) replaces `plan` + `generate_code`
+with a single `plan_and_code` node — one LLM call returns both, saving a
+round trip on small datasets the model can clean in one shot.
+
 NOTE: LangGraph requires a single shared TypedDict as graph state.
       We define `GraphState` here and adapt each node to read/write from it.
 """
 
-import os
+import functools
 from typing import TypedDict, Optional
 from langgraph.graph import StateGraph, END
 
@@ -24,13 +37,17 @@ from .nodes import (
     inspect_dataset,
     plan_cleaning,
     generate_code,
+    plan_and_code,
     execute_code,
     debug_code, 
-    feature_engineering_plan,
-    reset_retries,
-    retry_count,
+    feature_engineering_preview,
+    feature_engineering_refine,
+    dumps_profile,
     MAX_RETRIES,
 )
+from . import cache
+from .llm import llm
+from .prompts import PLAN_SYSTEM_PROMPT
 from .state import Input, Inspect, Plan, GenerateCode, ExecuteCode
 
 
@@ -54,27 +71,58 @@ class GraphState(TypedDict):
     error: Optional[str]
     cleaned_csv_path: Optional[str]
 
-    # Feature engineering
+    # Feature engineering — the draft is written before cleaning runs; only
+    # feature_eng_refine sets the plan, so a failed run never reports one
+    feature_engineering_draft: str
     feature_engineering_plan: str
 
+    # Self-correction loop — per run, so concurrent graphs never share it
+    retry_count: int
+    max_retries: int
+
 
 
 # ── Node Adapters ─────────────────────────────────────────────────────────────
-# Each adapter bridges GraphState ↔ the typed Pydantic state per node.
+# Each adapter bridges GraphState ↔ the typed per-node state dataclass.
 
 def node_inspect(state: GraphState) -> dict:
-    result = inspect_dataset(Input(raw_csv_path=state["raw_csv_path"]))
-    return {"data_profile": result.data_profile}
-
-
-def node_plan(state: GraphState) -> dict:
-    result = plan_cleaning(Inspect(data_profile=state["data_profile"]))
-    return {"cleaning_plan": result.cleaning_plan}
+    # Same file contents → same profile: skip the pandas pass on repeats
+    key = cache.make_key("profile", cache.file_sha256(state["raw_csv_path"]))
+    data_profile = cache.lookup(key)
+    if data_profile is None:
+        data_profile = inspect_dataset(Input(raw_csv_path=state["raw_csv_path"])).data_profile
+        cache.store(key, data_profile)
+    else:
+        print("🗄️  Reusing cached dataset profile.")
+    return {"data_profile": data_profile}
+
+
+async def node_plan(state: GraphState) -> dict:
+    # Keyed by the model + temperature, the profile text and the prompt itself,
+    # so switching models or editing the prompt invalidates old plans without
+    # a manual version bump
+    profile = state["data_profile"]
+    profile_text = profile.get("profile_text") or dumps_profile(profile)
+    key = cache.make_key("plan", cache.text_sha256(
+        llm.model_name, str(llm.temperature), profile_text, PLAN_SYSTEM_PROMPT,
+    ))
+    cleaning_plan = cache.lookup(key)
+    if cleaning_plan is None:
+        cleaning_plan = (await plan_cleaning(Inspect(data_profile=profile))).cleaning_plan
+        cache.store(key, cleaning_plan)
+    else:
+        print("🗄️  Reusing cached cleaning plan.")
+    return {"cleaning_plan": cleaning_plan}
+
+
+async def node_generate_code(state: GraphState) -> dict:
+    result = await generate_code(Plan(cleaning_plan=state["cleaning_plan"]))
+    return {"generated_code": result.generated_code}
 
 
-def node_generate_code(state: GraphState) -> dict:
-    result = generate_code(Plan(cleaning_plan=state["cleaning_plan"]))
-    return {"generated_code": result.generated_code}
+async def node_plan_and_code(state: GraphState) -> dict:
+    result = await plan_and_code(Inspect(data_profile=state["data_profile"]))
+    return {"cleaning_plan": result.cleaning_plan, "generated_code": result.generated_code}
 
 
 def node_execute_code(state: GraphState) -> dict:
@@ -82,68 +130,95 @@ def node_execute_code(state: GraphState) -> dict:
         GenerateCode(generated_code=state["generated_code"]),
         input_csv_path=state["raw_csv_path"],
         output_csv_path=state["output_csv_path"],
+        retry_count=state["retry_count"],
+        max_retries=state.get("max_retries", MAX_RETRIES),
     )
     return {"error": result.error, "cleaned_csv_path": result.cleaned_csv_path}
 
 
-def node_debug(state: GraphState) -> dict:
-    result = debug_code(
+async def node_debug(state: GraphState) -> dict:
+    result = await debug_code(
         ExecuteCode(error=state["error"], cleaned_csv_path=state["cleaned_csv_path"]),
         original_code=state["generated_code"],
+        retry_count=state["retry_count"],
+        max_retries=state.get("max_retries", MAX_RETRIES),
     )
-    return {"generated_code": result.generated_code}
+    return {"generated_code": result.generated_code, "retry_count": result.retry_count}
 
 
-def node_feature_engineering(state: GraphState) -> dict:
-    result = feature_engineering_plan(
-        ExecuteCode(cleaned_csv_path=state["cleaned_csv_path"])
+async def node_feature_engineering_preview(state: GraphState) -> dict:
+    result = await feature_engineering_preview(Inspect(data_profile=state["data_profile"]))
+    return {"feature_engineering_draft": result.feature_engineering_plan}
+
+
+async def node_feature_engineering_refine(state: GraphState) -> dict:
+    result = await feature_engineering_refine(
+        ExecuteCode(cleaned_csv_path=state["cleaned_csv_path"]),
+        draft_plan=state.get("feature_engineering_draft", ""),
+        raw_dtypes=state["data_profile"].get("dtypes", {}),
     )
     return {"feature_engineering_plan": result.feature_engineering_plan}
 
 
 # ── Conditional Router ────────────────────────────────────────────────────────
-# Called after execute_code. Decides: retry → "debug" | success → "feature_eng" | give up → END
+# Called after execute_code. Decides: retry → "debug" | success → "feature_eng_refine" | give up → END
 
 def route_after_execute(state: GraphState) -> str:
-    from . import nodes  # import module to read current retry_count
+    max_retries = state.get("max_retries", MAX_RETRIES)
 
     if state["error"] is None:
-        return "feature_eng"                     # ✅ success path
+        return "feature_eng_refine"              # ✅ success path
 
-    if nodes.retry_count < MAX_RETRIES:
+    if state["retry_count"] < max_retries:
         return "debug"                            # 🔧 retry path
 
-    print(f"💀 Max retries ({MAX_RETRIES}) reached. Ending with error.")
+    print(f"💀 Max retries ({max_retries}) reached. Ending with error.")
     return END                                    # ❌ give up
 
 
 # # ── Graph Builder ─────────────────────────────────────────────────────────────
 
-def build_graph() -> StateGraph:
-    reset_retries()
-
+@functools.lru_cache(maxsize=2)
+def build_graph(simple_mode: bool = False) -> StateGraph:
+    """
+    Compile the graph once per process. It holds no per-run state (retries
+    live in GraphState), so the same compiled object serves every input.
+    simple_mode=True plans and generates code in one LLM call (small
+    datasets); the default two-node path suits large/complex ones.
+    """
     g = StateGraph(GraphState)
 
     # Register nodes
     g.add_node("inspect", node_inspect)
-    g.add_node("plan", node_plan)
-    g.add_node("generate_code", node_generate_code)
+    if simple_mode:
+        g.add_node("plan_and_code", node_plan_and_code)
+    else:
+        g.add_node("plan", node_plan)
+        g.add_node("generate_code", node_generate_code)
     g.add_node("execute_code",    node_execute_code)
     g.add_node("debug",           node_debug)
-    g.add_node("feature_eng",     node_feature_engineering)
+    g.add_node("feature_eng_preview", node_feature_engineering_preview)
+    g.add_node("feature_eng_refine",  node_feature_engineering_refine)
 
-    # Linear edges
     g.set_entry_point("inspect")
-    g.add_edge("inspect", "plan")
-    g.add_edge("plan", "generate_code")
-    g.add_edge("generate_code", "execute_code")
+    g.add_edge("inspect", "feature_eng_preview")
+
+    if simple_mode:
+        # Fan out: plan_and_code + feature_eng_preview, fan in at execute_code
+        g.add_edge("inspect", "plan_and_code")
+        g.add_edge(["plan_and_code", "feature_eng_preview"], "execute_code")
+    else:
+        # Fan out: plan + feature_eng_preview, fan in at generate_code
+        g.add_edge("inspect", "plan")
+        g.add_edge(["plan", "feature_eng_preview"], "generate_code")
+        g.add_edge("generate_code", "execute_code")
 
     # Conditional edge after execute_code
     g.add_conditional_edges(
         "execute_code",
         route_after_execute,
         {
-            "feature_eng": "feature_eng",  # Success
+            "feature_eng_refine": "feature_eng_refine",  # Success
             "debug": "debug",  # retry
             END: END,  # max retries exceeded
         }
@@ -153,6 +228,6 @@ def build_graph() -> StateGraph:
     g.add_edge("debug", "execute_code")
 
     # After feature engineering -> done
-    g.add_edge("feature_eng", END)
+    g.add_edge("feature_eng_refine", END)
 
     return g.compile()
@@ -1,8 +1,11 @@
 import os
+from typing import AsyncIterator
 from dotenv import load_dotenv
-from langchain_core.messages import HumanMessage
+from langchain_core.messages import HumanMessage, SystemMessage
 from langchain_groq import ChatGroq
 
+from .llm_cache import LLMCache
+
 load_dotenv()
 
 llm = ChatGroq(
@@ -11,7 +14,102 @@ llm = ChatGroq(
     api_key=os.getenv("GROQ_API_KEY"),
 )
 
+# Same client with provider-side JSON mode — output is guaranteed to parse
+json_llm = llm.bind(response_format={"type": "json_object"})
+
+cache = LLMCache()
+
+# --- Prompt-cache usage ---
+# Accumulated across calls so callers can see how much of the static
+# system prefix the provider served from its cache. Groq reports usage only
+# in a stream's final chunk, so streams closed early at the code fence
+# (code-gen / debug) are never metered — they are counted in
+# `unmetered_calls` instead, so displays can say what the totals exclude.
+token_usage = {"input_tokens": 0, "cache_read_input_tokens": 0, "unmetered_calls": 0}
+
+
+async def acall_llm(system: str, user: str, json_mode: bool = False) -> str:
+    """
+    Send a static `system` prefix followed by the dynamic `user` message.
+    The system prompt must stay byte-identical between calls for the
+    provider's prefix cache to hit — never interpolate run data into it.
+    With json_mode=True the provider is asked for a JSON object response
+    (the system prompt must mention JSON).
+    Awaitable, so independent graph branches overlap their requests.
+    """
+    key = _cache_key(system, user, json_mode)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    client = json_llm if json_mode else llm
+    response = await client.ainvoke([SystemMessage(content=system), HumanMessage(content=user)])
+    _record_usage(response)
+    cache.set(key, response.content, ttl=3600)
+    return response.content
+
+
+def call_llm(system: str, user: str, json_mode: bool = False) -> str:
+    """
+    Blocking variant of acall_llm() for callers outside an event loop.
+    Uses the sync client rather than asyncio.run(acall_llm(...)): the async
+    client's connection pool is bound to the loop that opened it, and
+    asyncio.run would start (and close) a fresh loop on every call.
+    """
+    key = _cache_key(system, user, json_mode)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    client = json_llm if json_mode else llm
+    response = client.invoke([SystemMessage(content=system), HumanMessage(content=user)])
+    _record_usage(response)
+    cache.set(key, response.content, ttl=3600)
+    return response.content
+
+
+async def acall_llm_stream(system: str, user: str) -> AsyncIterator[str]:
+    """
+    Same request as acall_llm(), yielded chunk by chunk as it is generated.
+    Closing the generator early stops the request; the text received so far
+    is still cached, because callers only close once they have what they need.
+    """
+    key = _cache_key(system, user, json_mode=False)
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    stream = llm.astream([SystemMessage(content=system), HumanMessage(content=user)])
+    received = []
+    metered = False
+    try:
+        async for chunk in stream:
+            metered = _record_usage(chunk) or metered
+            received.append(chunk.content)
+            yield chunk.content
+    except GeneratorExit:
+        await stream.aclose()
+        if not metered:
+            token_usage["unmetered_calls"] += 1
+        cache.set(key, "".join(received), ttl=3600)
+        raise
+    cache.set(key, "".join(received), ttl=3600)
+
+
+def _cache_key(system: str, user: str, json_mode: bool):
+    return cache.cache_key(
+        llm.model_name,
+        {"system": system, "user": user, "json_mode": json_mode},
+        llm.temperature,
+    )
+
 
-def call_llm(prompt: str) -> str:
-    response = llm.invoke([HumanMessage(content=prompt)])
-    return response.content
\ No newline at end of file
+def _record_usage(response) -> bool:
+    """Add the response's token usage to token_usage; False if it carried none."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    token_usage["input_tokens"] += usage.get("input_tokens", 0)
+    token_usage["cache_read_input_tokens"] += (
+        usage.get("input_token_details", {}).get("cache_read", 0) or 0
+    )
+    return bool(usage)
@@ -0,0 +1,95 @@
+"""
+llm_cache.py — Exact-match response cache for deterministic LLM calls
+
+With temperature=0 the plan / code-gen / debug prompts are pure functions of
+the dataset profile, so re-running the same CSV repeats identical requests.
+Responses are keyed by a SHA-256 of (model, prompt, temperature) and kept in
+an in-memory LRU, plus an on-disk store (when `diskcache` is installed) so
+hits survive Streamlit reloads.
+"""
+
+import hashlib
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+import orjson
+
+try:
+    import diskcache
+except ImportError:  # persistence is optional — fall back to memory only
+    diskcache = None
+
+CACHE_DIR = Path.home() / ".dataclean_ai" / "cache"
+
+
+class LLMCache:
+    def __init__(self, maxsize: int = 512, ttl: int = 3600, cache_dir: Path = CACHE_DIR):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._memory: OrderedDict = OrderedDict()   # key -> (expires_at, content)
+        self._disk = diskcache.Cache(str(cache_dir)) if diskcache is not None else None
+        self.stats = {"hits": 0, "misses": 0}
+
+    @staticmethod
+    def cache_key(model: str, prompt: dict, temperature: float) -> Optional[str]:
+        """
+        Hash the request. Returns None for non-zero temperature — sampled
+        responses are not reproducible, so they are never cached.
+        """
+        if temperature != 0:
+            return None
+        payload = orjson.dumps(
+            {"model": model, "prompt": prompt, "temperature": temperature},
+            option=orjson.OPT_SORT_KEYS,
+        )
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[str]:
+        if key is None:
+            return None
+
+        value = self._get_memory(key)
+        if value is None and self._disk is not None:
+            value = self._disk.get(key)
+            if value is not None:
+                self._set_memory(key, value, self.ttl)
+
+        if value is None:
+            self.stats["misses"] += 1
+        else:
+            self.stats["hits"] += 1
+        print(
+            f"🗄️  LLM cache {'hit' if value is not None else 'miss'} "
+            f"(hits={self.stats['hits']}, misses={self.stats['misses']})",
+            file=sys.stderr,
+        )
+        return value
+
+    def set(self, key: Optional[str], value: str, ttl: Optional[int] = None) -> None:
+        if key is None:
+            return
+        ttl = self.ttl if ttl is None else ttl
+        self._set_memory(key, value, ttl)
+        if self._disk is not None:
+            self._disk.set(key, value, expire=ttl)
+
+    # ── In-memory LRU ─────────────────────────────────────────────────────────
+    def _get_memory(self, key: str) -> Optional[str]:
+        entry = self._memory.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._memory[key]
+            return None
+        self._memory.move_to_end(key)
+        return value
+
+    def _set_memory(self, key: str, value: str, ttl: int) -> None:
+        self._memory[key] = (time.monotonic() + ttl, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
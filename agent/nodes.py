@@ -1,38 +1,90 @@
+import ast
+import asyncio
 import io
 import os
 import traceback
 import json
+import multiprocessing
 import re
+import threading
+import numpy as np
+import orjson
 import pandas as pd
-from .state import Input, Inspect, Plan, GenerateCode, ExecuteCode, FeatureEngineering, Debug
-from .llm import call_llm
-
-# --- Global retry counter ---
-# Resets each time the pipeline starts fresh via reset_retries()
-retry_count = 0
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from typing import Optional
+from .state import Input, Inspect, Plan, GenerateCode, PlanAndCode, ExecuteCode, FeatureEngineering, Debug
+from .llm import acall_llm, acall_llm_stream
+from .prompts import (
+    PLAN_SYSTEM_PROMPT,
+    CODEGEN_SYSTEM_PROMPT,
+    PLAN_AND_CODE_SYSTEM_PROMPT,
+    DEBUG_SYSTEM_PROMPT,
+    FEATURE_ENG_SYSTEM_PROMPT,
+    FEATURE_ENG_REFINE_SYSTEM_PROMPT,
+)
+
+# --- Retry limit ---
+# Default cap on debug cycles. The live retry_count lives in GraphState so
+# concurrent runs never share a counter.
 MAX_RETRIES = 3
 
-
-def reset_retries():
-    global retry_count
-    retry_count = 0
+# --- Profiling sample ---
+# CSVs larger than this are profiled from their first SAMPLE_ROWS rows.
+SAMPLE_THRESHOLD_BYTES = 50 * 1024 * 1024
+SAMPLE_ROWS = 10_000
+
+# --- Code execution ---
+# Each piece of generated code runs in its own process: isolated from the
+# graph process, and killable on its own when it exceeds EXEC_TIMEOUT seconds
+# without touching code other runs are executing at the same moment.
+EXEC_TIMEOUT = 60
+EXEC_WORKERS = 2
+_GENERATED_FILENAME = "<generated_code>"   # marks generated-code frames in tracebacks
+# At most EXEC_WORKERS processes at once. Concurrent runs (batch mode) queue
+# here, before their process starts, so the timeout only ever counts a job's
+# own running time — never time spent waiting.
+_EXEC_SLOTS = threading.BoundedSemaphore(EXEC_WORKERS)
+
+# --- Precompiled patterns for LLM response parsing ---
+_CODE_FENCE  = re.compile(r"```(?:python)?\s*\n(.*?)```", re.DOTALL)
+_STRIP_FENCE = re.compile(r"```(?:python)?")
+_JSON_FENCE  = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")   # only a fence around the whole response
+_NL_ESCAPE   = re.compile(r"(?<!\\)\n")
+_TAB_ESCAPE  = re.compile(r"(?<!\\)\t")
+_BRACE       = re.compile(r"\{.*\}", re.DOTALL)
 
 
 # ── Node 1 ────────────────────────────────────────────────────────────────────
 def inspect_dataset(state: Input) -> Inspect:
-    for enc in ("utf-8", "latin-1", "cp1252"):
-        try:
-            df = pd.read_csv(state.raw_csv_path, encoding=enc)
-            break
-        except UnicodeDecodeError:
-            continue
-    else:
-        df = pd.read_csv(state.raw_csv_path, encoding="utf-8", encoding_errors="replace")
+    # Giant CSVs are profiled from their first SAMPLE_ROWS rows — mean/std/
+    # missing % barely move, and the full file is only parsed by execute_code
+    sampled = os.path.getsize(state.raw_csv_path) > SAMPLE_THRESHOLD_BYTES
+    df = _read_csv(state.raw_csv_path, nrows=SAMPLE_ROWS if sampled else None)
 
-    shape = df.shape
+    total_rows = _count_rows(state.raw_csv_path) if sampled else len(df)
+    shape = (total_rows, df.shape[1])
     dtypes = df.dtypes.astype(str).to_dict()
-    missing_pct = (df.isnull().mean() * 100).round(2).to_dict()
-    basic_stats = df.describe(include="all").round(4).to_dict()
+    missing_pct = (df.isna().sum() / len(df) * 100).round(2).to_dict()
+
+    # ── Summary stats: one vectorized agg for numeric cols, cheap counts for the rest ──
+    num_cols = df.select_dtypes(include="number").columns
+    obj_cols = df.select_dtypes(exclude="number").columns
+    # NaN → None once here, so the profile is JSON-safe and needs no NaN filtering later
+    num_stats = (
+        df[num_cols].agg(["mean", "std", "min", "max", "count"])
+        .round(4).replace({np.nan: None}).to_dict()
+        if len(num_cols) else {}
+    )
+    obj_stats = {}
+    for col in obj_cols:
+        mode = df[col].mode()
+        obj_stats[col] = {
+            "count": int(df[col].count()),
+            "nunique": int(df[col].nunique()),
+            "top": mode.iat[0] if not mode.empty else None,
+        }
+    basic_stats = {col: num_stats[col] if col in num_stats else obj_stats[col] for col in df.columns}
 
     # ── Detect type mismatches: object cols whose values are mostly numeric ──
     type_mismatches = {}
@@ -53,231 +105,432 @@ def inspect_dataset(state: Input) -> Inspect:
         "missing_pct": missing_pct,
         "basic_stats": basic_stats,
         "type_mismatches": type_mismatches,
+        "sampled": sampled,
     }
-
-    lines = []
-    lines.append(f"Dataset Shape: {shape[0]} rows × {shape[1]} columns\n")
-    lines.append("Column Types & Missing %:")
-    for col in df.columns:
-        lines.append(f"  - {col}: dtype={dtypes[col]}, missing={missing_pct[col]}%")
+    if sampled:
+        data_profile["sample_rows"] = len(df)
+        data_profile["total_rows_est"] = total_rows
+
+    shape_line = f"Dataset Shape: {shape[0]} rows × {shape[1]} columns"
+    if sampled:
+        shape_line += f" (stats below computed on the first {len(df):,} rows)"
+
+    sections = [
+        shape_line + "\n",
+        "Column Types & Missing %:",
+        "\n".join(
+            f"  - {col}: dtype={dtypes[col]}, missing={missing_pct[col]}%"
+            for col in df.columns
+        ),
+    ]
 
     if type_mismatches:
-        lines.append("\n⚠️  TYPE MISMATCHES DETECTED (object columns that should be numeric):")
-        for col, info in type_mismatches.items():
-            lines.append(
-                f"  - {col}: stored as object but {info['numeric_ratio']}% of values "
-                f"are numeric → should be {info['suggested_dtype']}"
-            )
-
-    lines.append("\nBasic Statistics:")
-    for col, stats in basic_stats.items():
-        stat_str = ", ".join(
-            f"{k}={v}"
-            for k, v in stats.items()
-            if v is not None and str(v) != "nan"
-        )
-        lines.append(f"  {col}: {stat_str}")
-
-    profile_text = "\n".join(lines)
+        sections.append("\n⚠️  TYPE MISMATCHES DETECTED (object columns that should be numeric):")
+        sections.append("\n".join(
+            f"  - {col}: stored as object but {info['numeric_ratio']}% of values "
+            f"are numeric → should be {info['suggested_dtype']}"
+            for col, info in type_mismatches.items()
+        ))
+
+    sections.append("\nBasic Statistics:")
+    sections.append("\n".join(
+        f"  {col}: " + ", ".join(f"{k}={v}" for k, v in stats.items() if v is not None)
+        for col, stats in basic_stats.items()
+    ))
+
+    profile_text = "\n".join(sections)
     return Inspect(data_profile={**data_profile, "profile_text": profile_text})
 
 
 # ── Node 2 ────────────────────────────────────────────────────────────────────
-def plan_cleaning(state: Inspect) -> Plan:
-    profile_text = state.data_profile.get("profile_text", str(state.data_profile))
+async def plan_cleaning(state: Inspect) -> Plan:
+    profile_text = _profile_text(state.data_profile)
 
-    prompt = f"""You are an expert data scientist. Analyze the following dataset profile and create a step-by-step data cleaning plan.
-
-Dataset Profile:
+    user = f"""Dataset Profile:
 {profile_text}
-
-For EVERY column, address all of the following issues if present:
-1. Missing values — choose median/mode/forward-fill/drop based on column type and missingness rate.
-2. Dtype mismatches — if a column is labeled as an "⚠️ TYPE MISMATCH", it must be coerced to the suggested numeric type using pd.to_numeric().
-3. Duplicate rows — check and drop if present.
-4. Inconsistent categories — standardize casing and whitespace in categorical columns.
-5. Outliers — flag and treat extreme values where appropriate.
-
-IMPORTANT: Dtype coercion must happen BEFORE missing value imputation, because string-valued numeric columns (e.g. "475") cannot be median-imputed until they are converted to numbers first.
-
-Return your plan as plain text only. Do NOT wrap it in JSON or code blocks.
 """
 
-    response = call_llm(prompt)
+    response = await acall_llm(PLAN_SYSTEM_PROMPT, user)
     return Plan(cleaning_plan=response.strip())
 
 
 # ── Node 3 ────────────────────────────────────────────────────────────────────
-def generate_code(state: Plan) -> GenerateCode:
-    prompt = f"""You are a Python data cleaning expert. Write Python code to implement the following cleaning plan.
-
-Cleaning Plan:
+async def generate_code(state: Plan) -> GenerateCode:
+    user = f"""Cleaning Plan:
 {state.cleaning_plan}
-
-Requirements:
-- Use pandas. The input CSV path is available as the variable `input_csv_path` (already defined).
-- Save the cleaned dataframe to `output_csv_path` (already defined) using df.to_csv(output_csv_path, index=False).
-- Do NOT include any import statements — pandas is already imported as pd.
-- Do NOT wrap in a function. Write flat, executable code.
-- DTYPE COERCION IS MANDATORY: For every column that should be numeric but is stored as object/string,
-  use `pd.to_numeric(df[col], errors='coerce')` to convert it BEFORE doing any imputation.
-  This handles quoted numbers like "475" or mixed-type columns.
-  After converting, cast integer columns with `df[col] = df[col].astype('Int64')` (nullable integer).
-- Perform dtype coercion as the very first step, before any missing value filling.
-
-Return ONLY the Python code inside a ```python ... ``` code block. Nothing else.
 """
 
-    response = call_llm(prompt)
-    code = _extract_code(response)
+    code = await _stream_code(CODEGEN_SYSTEM_PROMPT, user)
     return GenerateCode(generated_code=code)
 
 
+# ── Node 2+3 (simple mode) ────────────────────────────────────────────────────
+async def plan_and_code(state: Inspect) -> PlanAndCode:
+    """
+    Single-call replacement for plan_cleaning() + generate_code(), used in
+    simple mode: one JSON-mode request returns both the plan and the code,
+    saving a full LLM round trip on datasets the model can one-shot.
+    """
+    profile_text = _profile_text(state.data_profile)
+
+    user = f"""Dataset Profile:
+{profile_text}
+"""
+
+    response = await acall_llm(PLAN_AND_CODE_SYSTEM_PROMPT, user, json_mode=True)
+    parsed = _parse_json(response)
+    return PlanAndCode(
+        cleaning_plan=str(parsed.get("cleaning_plan", "")).strip(),
+        # Strip any fences the model added despite the instructions
+        generated_code=_extract_code(str(parsed.get("generated_code", ""))),
+    )
+
+
 # ── Node 4 ────────────────────────────────────────────────────────────────────
-def execute_code(state: GenerateCode, input_csv_path: str, output_csv_path: str) -> ExecuteCode:
+def execute_code(
+    state: GenerateCode,
+    input_csv_path: str,
+    output_csv_path: str,
+    retry_count: int = 0,
+    max_retries: int = MAX_RETRIES,
+) -> ExecuteCode:
     """
-    Runs the generated Python code in a sandboxed namespace.
-    input_csv_path and output_csv_path are injected into the exec namespace
-    so the LLM-generated code can use them directly.
+    Runs the generated Python code in a separate process (see _run_code).
+    input_csv_path, output_csv_path and pd / pa / pacsv are injected into the
+    exec namespace so the LLM-generated code can use them directly.
+    Code still running after EXEC_TIMEOUT seconds is killed with its process.
     Returns ExecuteCode with:
       - error=None, cleaned_csv_path set  → success
-      - error=<traceback>, cleaned_csv_path=None → failure (trigger debug)
+      - error=<message>, cleaned_csv_path=None → failure (trigger debug)
+    """
+    # Syntax errors / a missing save are caught statically — no exec needed
+    error_msg = _check_code(state.generated_code)
+    if error_msg is None:
+        error_msg = _run_in_subprocess(state.generated_code, input_csv_path, output_csv_path)
+
+    if error_msg is None:
+        print(f"✅ Code executed successfully. Output: {output_csv_path}")
+        return ExecuteCode(error=None, cleaned_csv_path=output_csv_path)
+
+    print(f"❌ Execution error (attempt {retry_count + 1}/{max_retries}):\n{error_msg}")
+    return ExecuteCode(error=error_msg, cleaned_csv_path=None)
+
+
+def _check_code(code: str) -> Optional[str]:
+    """
+    Static pre-flight on the generated code, in microseconds.
+    Returns an error message for a SyntaxError, or when no call ever writes
+    to `output_csv_path` (df.to_csv / pacsv.write_csv); None if it looks runnable.
+    """
+    try:
+        tree = ast.parse(code, mode="exec")
+    except SyntaxError as e:
+        return f"SyntaxError: {e.msg} at line {e.lineno}"
+
+    finder = _OutputWriteFinder()
+    finder.visit(tree)
+    if not finder.found:
+        return (
+            "ValueError: the code never saves the cleaned dataframe — "
+            "it must call df.to_csv(output_csv_path, index=False)."
+        )
+    return None
+
+
+class _OutputWriteFinder(ast.NodeVisitor):
+    """Looks for `<obj>.to_csv(...)` / `<obj>.write_csv(...)` passed `output_csv_path`."""
+
+    WRITERS = {"to_csv", "write_csv"}
+
+    def __init__(self):
+        self.found = False
+
+    def visit_Call(self, node: ast.Call):
+        if isinstance(node.func, ast.Attribute) and node.func.attr in self.WRITERS:
+            values = [*node.args, *(kw.value for kw in node.keywords)]
+            if any(isinstance(v, ast.Name) and v.id == "output_csv_path" for v in values):
+                self.found = True
+                return
+        self.generic_visit(node)
+
+
+def _run_in_subprocess(code: str, input_csv_path: str, output_csv_path: str) -> Optional[str]:
+    """
+    Run _run_code in a dedicated process, enforcing EXEC_TIMEOUT.
+    Returns None or an error. A timeout kills only this job's process.
+    """
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(
+        target=_exec_worker,
+        args=(sender, code, input_csv_path, output_csv_path),
+        daemon=True,
+    )
+    with _EXEC_SLOTS:
+        proc.start()
+        sender.close()   # the child holds the only write end, so its exit means EOF
+        try:
+            if not receiver.poll(EXEC_TIMEOUT):
+                proc.kill()
+                return (
+                    f"TimeoutError: code did not finish within {EXEC_TIMEOUT}s "
+                    "and was killed (possible infinite loop)."
+                )
+            try:
+                return receiver.recv()
+            except EOFError:   # exited without reporting — segfault, OOM kill, os._exit
+                return "RuntimeError: the worker process running the code crashed."
+        finally:
+            proc.join()
+            receiver.close()
+
+
+def _exec_worker(conn, code: str, input_csv_path: str, output_csv_path: str) -> None:
+    """Child-process entry point: report _run_code's result back over the pipe."""
+    conn.send(_run_code(code, input_csv_path, output_csv_path))
+    conn.close()
+
+
+def _run_code(code: str, input_csv_path: str, output_csv_path: str) -> Optional[str]:
+    """
+    Exec the generated code in a fresh namespace, so nothing leaks between
+    retries. Returns None on success, else a compact error message
+    (see _format_error).
     """
     namespace = {
         "pd": pd,
+        "pa": pa,
+        "pacsv": pacsv,
         "input_csv_path": input_csv_path,
         "output_csv_path": output_csv_path,
     }
 
     try:
-        exec(state.generated_code, namespace)  # noqa: S102
-        print(f"✅ Code executed successfully. Output: {output_csv_path}")
-        return ExecuteCode(error=None, cleaned_csv_path=output_csv_path)
+        exec(compile(code, _GENERATED_FILENAME, "exec"), namespace)  # noqa: S102
+        return None
+    except BaseException as e:   # exit() / sys.exit() are errors too, not a way out
+        return _format_error(e, code)
 
-    except Exception:
-        error_msg = traceback.format_exc()
-        print(f"❌ Execution error (attempt {retry_count + 1}/{MAX_RETRIES}):\n{error_msg}")
-        return ExecuteCode(error=error_msg, cleaned_csv_path=None)
+
+def _format_error(e: BaseException, code: str) -> str:
+    """
+    `<Type>: <message>` plus the last few failing lines of the generated code.
+    Frames from exec, pandas internals and site-packages are dropped — they
+    cost the debug prompt hundreds of tokens without helping the fix.
+    """
+    source = code.splitlines()
+    frames = [
+        f for f in traceback.extract_tb(e.__traceback__)
+        if f.filename == _GENERATED_FILENAME
+    ]
+    lines = [f"{type(e).__name__}: {e}"]
+    for f in frames[-3:]:
+        line = source[f.lineno - 1].strip() if f.lineno and f.lineno <= len(source) else ""
+        lines.append(f"  Line {f.lineno}: {line}")
+    return "\n".join(lines)
 
 
 # ── Node 5 ────────────────────────────────────────────────────────────────────
-def debug_code(state: ExecuteCode, original_code: str) -> Debug:
+async def debug_code(
+    state: ExecuteCode,
+    original_code: str,
+    retry_count: int,
+    max_retries: int = MAX_RETRIES,
+) -> Debug:
     """
-    Reads the error traceback + the code that caused it,
+    Reads the error message + the code that caused it,
     asks the LLM to fix it, and returns corrected code.
     Called only when execute_code returns an error.
+    `retry_count` is the number of debug attempts made so far; the
+    returned Debug carries it incremented by one.
     """
-    global retry_count
     retry_count += 1
 
-    print(f"🔧 Debug attempt {retry_count}/{MAX_RETRIES}...")
+    print(f"🔧 Debug attempt {retry_count}/{max_retries}...")
 
-    prompt = f"""You are a Python debugging expert. The following code threw an error. Fix it.
-
---- Buggy Code ---
+    user = f"""--- Buggy Code ---
 {original_code}
 
---- Error Traceback ---
+--- Error ---
 {state.error}
+"""
+
+    code = await _stream_code(DEBUG_SYSTEM_PROMPT, user)
+    return Debug(generated_code=code, retry_count=retry_count)
 
-Requirements (same as before):
-- Use pandas (imported as pd). Variables `input_csv_path` and `output_csv_path` are already defined.
-- Do NOT add import statements. Do NOT wrap in a function.
-- Save the cleaned dataframe using df.to_csv(output_csv_path, index=False).
 
-Return ONLY the fixed Python code inside a ```python ... ``` code block. Nothing else.
+# ── Node 6a ───────────────────────────────────────────────────────────────────
+async def feature_engineering_preview(state: Inspect) -> FeatureEngineering:
+    """
+    Runs right after inspect_dataset(), in parallel with plan_cleaning().
+    Drafts a feature engineering plan from the RAW profile so this LLM call
+    overlaps with planning instead of waiting for the cleaned CSV.
+    """
+    profile_text = _profile_text(state.data_profile)
+
+    user = f"""Dataset Profile (raw — cleaning runs separately, assume missing values and type mismatches will be fixed):
+{profile_text}
 """
 
-    response = call_llm(prompt)
-    code = _extract_code(response)
-    return Debug(generated_code=code)
+    response = await acall_llm(FEATURE_ENG_SYSTEM_PROMPT, user)
+    print("📊 Feature engineering draft ready.")
+    return FeatureEngineering(feature_engineering_plan=response.strip())
 
 
-# ── Node 6 ────────────────────────────────────────────────────────────────────
-def feature_engineering_plan(state: ExecuteCode) -> FeatureEngineering:
+# ── Node 6b ───────────────────────────────────────────────────────────────────
+async def feature_engineering_refine(
+    state: ExecuteCode, draft_plan: str, raw_dtypes: dict
+) -> FeatureEngineering:
     """
     Runs after execute_code() succeeds.
-    Reads the cleaned CSV and asks the LLM to suggest feature engineering steps.
+    Reads the cleaned CSV and adapts the draft plan to its final schema.
+    Skips the LLM entirely when cleaning left columns and dtypes unchanged.
     """
-    # Try multiple encodings in case the CSV uses a non-UTF-8 encoding
-    for enc in ("utf-8", "latin-1", "cp1252"):
-        try:
-            df = pd.read_csv(state.cleaned_csv_path, encoding=enc)
-            break
-        except UnicodeDecodeError:
-            continue
-    else:
-        df = pd.read_csv(state.cleaned_csv_path, encoding="utf-8", encoding_errors="replace")
+    # Only the schema and 3 sample rows go into the prompt — the first 1000
+    # rows give representative dtypes without parsing the whole file.
+    # File I/O runs in a thread so the event loop keeps serving other branches
+    df = await asyncio.to_thread(_read_csv, state.cleaned_csv_path, 1000)
 
-    shape = df.shape
+    shape = (await asyncio.to_thread(_count_rows, state.cleaned_csv_path), df.shape[1])
     dtypes = df.dtypes.astype(str).to_dict()
+
+    if draft_plan and dtypes == raw_dtypes:
+        print("📊 Schema unchanged by cleaning — keeping feature engineering draft.")
+        return FeatureEngineering(feature_engineering_plan=draft_plan)
+
     sample = df.head(3).to_string()
 
-    prompt = f"""You are a machine learning expert. Given the following cleaned dataset profile, suggest a concrete feature engineering plan to improve model performance.
+    user = f"""--- Draft Plan ---
+{draft_plan}
 
+--- Cleaned Dataset ---
 Dataset Shape: {shape[0]} rows × {shape[1]} columns
 Column Types: {dtypes}
 
 Sample rows:
 {sample}
-
-For each suggestion explain:
-- Which column(s) to transform
-- What transformation to apply (e.g., log, one-hot encode, bin, interaction feature)
-- Why it would help a ML model
-
-Return your plan as plain text only. Do NOT wrap it in JSON or code blocks.
 """
 
-    response = call_llm(prompt)
+    response = await acall_llm(FEATURE_ENG_REFINE_SYSTEM_PROMPT, user)
     print("📊 Feature engineering plan ready.")
     return FeatureEngineering(feature_engineering_plan=response.strip())
 
 
 # ── Helpers ───────────────────────────────────────────────────────────────────
+def _profile_text(data_profile: dict) -> str:
+    """The prompt-ready profile text, serializing the raw dict only if it's missing."""
+    if "profile_text" in data_profile:
+        return data_profile["profile_text"]
+    return dumps_profile(data_profile)
+
+
+def dumps_profile(data_profile: dict) -> str:
+    """
+    JSON-encode a data_profile with orjson — numpy scalars are serialized
+    natively (no per-value .item() calls) and anything else falls back to str.
+    """
+    return orjson.dumps(
+        data_profile,
+        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS,
+        default=str,
+    ).decode("utf-8")
+
+
+def _read_csv(path: str, nrows: Optional[int] = None) -> pd.DataFrame:
+    """
+    Read a CSV, trying common encodings so non-UTF-8 files load fine.
+    Always the C engine — the same parser the generated code's plain
+    pd.read_csv uses. The pyarrow engine infers dtypes differently (e.g.
+    timestamps come back as datetime64), so the profile would describe
+    columns the generated code never sees. Falls back to replacing bad
+    bytes if every encoding fails.
+    """
+    for enc in ("utf-8", "latin-1", "cp1252"):
+        try:
+            return pd.read_csv(path, encoding=enc, nrows=nrows)
+        except UnicodeDecodeError:
+            continue
+    return pd.read_csv(path, encoding="utf-8", encoding_errors="replace", nrows=nrows)
+
+
+def _count_rows(path: str) -> int:
+    """
+    Count data rows by scanning newlines in 1 MiB binary blocks — no parsing.
+    Quoted fields with embedded newlines make this a slight overestimate.
+    """
+    newlines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            newlines += block.count(b"\n")
+            last = block[-1:]
+    if last != b"\n":       # final line has no trailing newline
+        newlines += 1
+    return max(newlines - 1, 0)   # minus the header
+
+
+async def _stream_code(system: str, user: str) -> str:
+    """
+    Stream the LLM response and return as soon as a complete ```python fence
+    has arrived, closing the stream instead of waiting for any trailing prose.
+    Falls back to _extract_code on the full text if no fence ever closes.
+    """
+    buf = io.StringIO()
+    stream = acall_llm_stream(system, user)
+    try:
+        async for chunk in stream:
+            buf.write(chunk)
+            if "`" in chunk and (match := _CODE_FENCE.search(buf.getvalue())):
+                return match.group(1).strip()
+    finally:
+        await stream.aclose()
+    return _extract_code(buf.getvalue())
+
+
 def _extract_code(text: str) -> str:
     """
     Extract Python code from a markdown ```python ... ``` fence.
     Falls back to returning the raw text if no fence is found.
     """
-    match = re.search(r"```(?:python)?\s*\n(.*?)```", text, re.DOTALL)
+    match = _CODE_FENCE.search(text)
     if match:
         return match.group(1).strip()
     # Fallback: strip any stray fences and return as-is
-    return re.sub(r"```(?:python)?", "", text).strip()
+    return _STRIP_FENCE.sub("", text).strip()
 
 
 def _parse_json(text: str) -> dict:
     """
     Robustly extract a JSON object from LLM response text.
-    Handles: markdown fences, unescaped newlines inside string values.
-    Used only for code-returning nodes where JSON is necessary.
+    Handles: a markdown fence around the whole object, unescaped newlines
+    inside string values. Fences *inside* string values are left alone —
+    plan_and_code() strips those from the code with _extract_code().
     """
-    # Strip markdown fences
-    text = re.sub(r"```(?:json)?\s*", "", text).strip()
+    # Strip an outer markdown fence
+    text = _JSON_FENCE.sub("", text).strip()
 
-    # Attempt 1: direct parse
+    # Attempt 1: direct parse — strict=False already tolerates raw control
+    # characters inside strings, so the regex sanitize pass is rarely needed
     try:
-        return json.loads(text)
+        return json.loads(text, strict=False)
     except json.JSONDecodeError:
         pass
 
     # Attempt 2: sanitize unescaped control characters inside string values
-    sanitized = re.sub(r'(?<!\\)\n', '\\n', text)
-    sanitized = re.sub(r'(?<!\\)\t', '\\t', sanitized)
+    sanitized = _NL_ESCAPE.sub('\\n', text)
+    sanitized = _TAB_ESCAPE.sub('\\t', sanitized)
     try:
         return json.loads(sanitized)
     except json.JSONDecodeError:
         pass
 
     # Attempt 3: find the outermost {...} block and parse that
-    match = re.search(r'\{.*\}', text, re.DOTALL)
+    match = _BRACE.search(text)
     if match:
         try:
             return json.loads(match.group())
         except json.JSONDecodeError:
             try:
-                sanitized = re.sub(r'(?<!\\)\n', '\\n', match.group())
+                sanitized = _NL_ESCAPE.sub('\\n', match.group())
                 return json.loads(sanitized)
             except json.JSONDecodeError:
                 pass
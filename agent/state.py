@@ -1,36 +1,51 @@
-from pydantic import BaseModel
+from dataclasses import dataclass
 from typing import Optional
 
-class Input(BaseModel):
+@dataclass(slots=True, frozen=True)
+class Input:
     raw_csv_path: str
 
-class Inspect(BaseModel):
+@dataclass(slots=True, frozen=True)
+class Inspect:
     # Input state: raw_csv_path: str
     # Output state: 
     data_profile: dict
 
-class Plan(BaseModel):
+@dataclass(slots=True, frozen=True)
+class Plan:
     # Input state: data_profile: dict
     # Output state:
     cleaning_plan: str
 
-class GenerateCode(BaseModel):
+@dataclass(slots=True, frozen=True)
+class GenerateCode:
     # Input state: cleaning_plan: str
     # Output state: 
     generated_code: str
 
-class ExecuteCode(BaseModel):
+@dataclass(slots=True, frozen=True)
+class PlanAndCode:
+    # Input state: data_profile: dict
+    # Output state: (plan + code from a single LLM call)
+    cleaning_plan: str
+    generated_code: str
+
+@dataclass(slots=True, frozen=True)
+class ExecuteCode:
     # Input state: generated_code: str
     # Output state: 
-    error: Optional[str] = None      # None = success, str = traceback
+    error: Optional[str] = None      # None = success, str = error message
     cleaned_csv_path: Optional[str] = None
 
-class FeatureEngineering(BaseModel):
+@dataclass(slots=True, frozen=True)
+class FeatureEngineering:
     # Input state: cleaned_csv_path: str
     # Output state: 
     feature_engineering_plan: str
 
-class Debug(BaseModel):
+@dataclass(slots=True, frozen=True)
+class Debug:
     # Input state: error: str
     # Output state:
-    generated_code: str
\ No newline at end of file
+    generated_code: str
+    retry_count: int
\ No newline at end of file
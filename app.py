@@ -3,37 +3,47 @@ app.py — Streamlit UI for the Data Cleaning Agent
 Run: streamlit run app.py
 """
 
+import asyncio
 import os
-import sys
 import tempfile
+import threading
 import streamlit as st
 import pandas as pd
 
+from agent import cache as profile_cache
+from agent.graph import build_graph
+from agent.llm import cache as llm_cache, token_usage
+
 # ── Encoding-safe CSV reader ──────────────────────────────────────────────────
-def read_csv_safe(path_or_buf) -> pd.DataFrame:
+def read_csv_safe(path_or_buf, engine=None) -> pd.DataFrame:
     """Try common encodings so non-UTF-8 files (latin-1, cp1252, etc.) load fine."""
     for enc in ("utf-8", "latin-1", "cp1252"):
         try:
             if hasattr(path_or_buf, "seek"):
                 path_or_buf.seek(0)
-            return pd.read_csv(path_or_buf, encoding=enc)
+            df = pd.read_csv(path_or_buf, encoding=enc, engine=engine)
         except (UnicodeDecodeError, Exception):
             continue
+        # The pyarrow engine doesn't raise on undecodable text — it returns
+        # those columns as raw bytes — so treat that as a failed encoding too
+        if not _has_bytes_column(df):
+            return df
     # Last resort: replace bad bytes silently
     if hasattr(path_or_buf, "seek"):
         path_or_buf.seek(0)
     return pd.read_csv(path_or_buf, encoding="utf-8", encoding_errors="replace")
 
-# ── Page Config ───────────────────────────────────────────────────────────────
-st.set_page_config(
-    page_title="DataClean AI",
-    page_icon="🧹",
-    layout="wide",
-    initial_sidebar_state="collapsed",
-)
 
-# ── Custom CSS ────────────────────────────────────────────────────────────────
-st.markdown("""
+def _has_bytes_column(df: pd.DataFrame) -> bool:
+    # A binary column is bytes throughout, so its first value is enough
+    for col in df.select_dtypes(include="object").columns:
+        first = df[col].first_valid_index()
+        if first is not None and isinstance(df[col].at[first], bytes):
+            return True
+    return False
+
+# Page stylesheet (injected in the Custom CSS section below)
+CUSTOM_CSS = """
 <style>
   @import url('https://fonts.googleapis.com/css2?family=Inter:wght@300;400;500;600;700&display=swap');
 
@@ -187,7 +197,57 @@ st.markdown("""
     border-radius: 12px !important;
   }
 </style>
-""", unsafe_allow_html=True)
+"""
+
+# Rows rendered in the cleaned-data table; the download always has every row
+PREVIEW_ROWS = 1000
+
+# ── Compiled graph ────────────────────────────────────────────────────────────
+@st.cache_resource
+def get_graph(simple_mode: bool = False):
+    """Compile the LangGraph once per server process and reuse it across reruns."""
+    return build_graph(simple_mode=simple_mode)
+
+# ── Async bridge ──────────────────────────────────────────────────────────────
+# The graph's LLM nodes are async. One background event loop per server keeps
+# the async LLM client's connection pool on a live loop across runs/sessions.
+_STREAM_DONE = object()
+
+
+@st.cache_resource
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return loop
+
+
+async def _anext(agen):
+    try:
+        return await agen.__anext__()
+    except StopAsyncIteration:
+        return _STREAM_DONE
+
+
+def stream_graph(graph, inputs: dict):
+    """Iterate graph.astream() from the sync Streamlit script, one event at a time."""
+    loop = get_event_loop()
+    agen = graph.astream(inputs)
+    try:
+        while (event := asyncio.run_coroutine_threadsafe(_anext(agen), loop).result()) is not _STREAM_DONE:
+            yield event
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+# ── Page Config ───────────────────────────────────────────────────────────────
+st.set_page_config(
+    page_title="DataClean AI",
+    page_icon="🧹",
+    layout="wide",
+    initial_sidebar_state="collapsed",
+)
+
+# ── Custom CSS ────────────────────────────────────────────────────────────────
+st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
 
 # ── Hero ──────────────────────────────────────────────────────────────────────
 st.markdown("""
@@ -236,6 +296,10 @@ with left:
 
     st.markdown("#### ⚙️ Settings")
     max_retries = st.slider("Max self-correction retries", 1, 5, 3)
+    simple_mode = st.checkbox(
+        "⚡ Single-call mode (plan + code together — best for small datasets)",
+        value=False,
+    )
 
     run_btn = st.button("🚀 Run Cleaning Agent", disabled=not uploaded)
 
@@ -260,20 +324,16 @@ with right:
         os.makedirs(out_dir, exist_ok=True)
         output_path = os.path.join(out_dir, "cleaned_output.csv")
 
-        # ── Import graph ──────────────────────────────────────────────────
-        from agent.graph import build_graph
-        from agent import nodes as agent_nodes
-
-        agent_nodes.MAX_RETRIES = max_retries
-
-        # ── Live progress using graph.stream() ───────────────────────────
+        # ── Live progress using graph.astream() ──────────────────────────
         NODE_LABELS = {
             "inspect":       ("🔍", "Inspecting dataset"),
             "plan":          ("🧠", "Planning cleaning strategy"),
             "generate_code": ("✍️", "Generating cleaning code"),
+            "plan_and_code": ("🧠", "Planning & generating code"),
             "execute_code":  ("⚙️", "Executing code"),
             "debug":         ("🔧", "Self-correcting code"),
-            "feature_eng":   ("📊", "Planning feature engineering"),
+            "feature_eng_preview": ("📊", "Drafting feature engineering"),
+            "feature_eng_refine":  ("📊", "Planning feature engineering"),
         }
 
         results = {}
@@ -286,9 +346,9 @@ with right:
         error_occurred = False
 
         with st.status("🤖 Agent is running...", expanded=True) as status_box:
-            graph = build_graph()
+            graph = get_graph(simple_mode)
 
-            for event in graph.stream({
+            for event in stream_graph(graph, {
                 "raw_csv_path":             input_path,
                 "output_csv_path":          output_path,
                 "data_profile":             {},
@@ -296,7 +356,10 @@ with right:
                 "generated_code":           "",
                 "error":                    None,
                 "cleaned_csv_path":         None,
+                "feature_engineering_draft": "",
                 "feature_engineering_plan": "",
+                "retry_count":              0,
+                "max_retries":              max_retries,
             }):
                 for node_name, node_state in event.items():
                     if node_name in ("__start__", "__end__"):
@@ -307,7 +370,7 @@ with right:
                     # Capture results from state updates
                     if "cleaning_plan" in node_state and node_state["cleaning_plan"]:
                         cleaning_plan = node_state["cleaning_plan"]
-                    if "feature_engineering_plan" in node_state and node_state["feature_engineering_plan"]:
+                    if node_name == "feature_eng_refine" and node_state.get("feature_engineering_plan"):
                         fe_plan = node_state["feature_engineering_plan"]
                     if "cleaned_csv_path" in node_state and node_state["cleaned_csv_path"]:
                         cleaned_csv_path = node_state["cleaned_csv_path"]
@@ -349,7 +412,7 @@ with right:
 
         with tab3:
             if cleaned_csv_path and os.path.exists(cleaned_csv_path):
-                cleaned_df = read_csv_safe(cleaned_csv_path)
+                cleaned_df = read_csv_safe(cleaned_csv_path, engine="pyarrow")
 
                 # Stats row
                 orig_shape = preview_df.shape
@@ -371,13 +434,34 @@ with right:
                 </div>
                 """, unsafe_allow_html=True)
 
-                st.dataframe(cleaned_df, use_container_width=True)
+                st.dataframe(cleaned_df.head(PREVIEW_ROWS), use_container_width=True)
+                if cleaned_df.shape[0] > PREVIEW_ROWS:
+                    st.caption(f"Showing the first {PREVIEW_ROWS:,} of {cleaned_df.shape[0]:,} rows.")
+
+                # Serve the file the agent already wrote — no pandas re-encode
+                with open(cleaned_csv_path, "rb") as f_out:
+                    cleaned_bytes = f_out.read()
 
                 st.download_button(
                     label="⬇️ Download Cleaned CSV",
-                    data=cleaned_df.to_csv(index=False).encode("utf-8"),
+                    data=cleaned_bytes,
                     file_name="cleaned_output.csv",
                     mime="text/csv",
                 )
             else:
                 st.error("Cleaned CSV not found — the agent may have exhausted all retries.")
+
+# ── Sidebar — cache stats (whole server process) ──────────────────────────────
+with st.sidebar:
+    st.markdown("#### 🗄️ Cache")
+    st.metric("Profile / plan hits", profile_cache.stats["hits"])
+    st.metric("Profile / plan misses", profile_cache.stats["misses"])
+    st.metric("LLM response hits", llm_cache.stats["hits"])
+    st.metric("LLM response misses", llm_cache.stats["misses"])
+    st.metric(
+        "Prompt tokens served from provider cache",
+        f'{token_usage["cache_read_input_tokens"]:,} / {token_usage["input_tokens"]:,}',
+        help="Excludes streamed code-gen / debug calls closed at the code fence — "
+             "the provider reports their usage only at the end of the stream.",
+    )
+    st.caption(f'Not metered: {token_usage["unmetered_calls"]} streamed call(s)')
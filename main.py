@@ -4,41 +4,142 @@ main.py — Entry point for the Data Cleaning Agent
 Usage:
     python main.py                          # uses default dirty test CSV
     python main.py data/raw/custom.csv      # pass your own CSV
+    python main.py 'data/raw/*.csv'         # batch: clean every match concurrently
+    python main.py --simple [path.csv]      # plan + code in a single LLM call
 """
 
+import asyncio
+import glob
 import sys
 import os
 from agent.graph import build_graph
+from agent.llm import token_usage
+from agent.nodes import MAX_RETRIES
 
 # ── Paths ─────────────────────────────────────────────────────────────────────
+ARGS        = [a for a in sys.argv[1:] if a != "--simple"]
+SIMPLE_MODE = "--simple" in sys.argv[1:]
+
 BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
-INPUT_CSV  = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BASE_DIR, "data", "raw", "dirty_titanic.csv")
-OUTPUT_CSV = os.path.join(BASE_DIR, "data", "cleaned", "cleaned_output.csv")
+OUTPUT_DIR = os.path.join(BASE_DIR, "data", "cleaned")
+OUTPUT_CSV = os.path.join(OUTPUT_DIR, "cleaned_output.csv")
+
+# Globs are expanded here too, so quoted patterns work without shell help.
+# A path that matches nothing is kept as-is and fails loudly in inspect.
+# The same file named twice (or matched by two patterns) is cleaned once.
+INPUT_CSVS = list(dict.fromkeys(
+    os.path.abspath(path)
+    for arg in (ARGS or [os.path.join(BASE_DIR, "data", "raw", "dirty_titanic.csv")])
+    for path in (sorted(glob.glob(arg)) or [arg])
+))
+
+# Graph runs in flight at once in batch mode — each is LLM-bound, so this is
+# what keeps a large batch under Groq's rate limits.
+MAX_CONCURRENT_RUNS = 8
+
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+
+def _output_paths(input_csvs: list) -> dict:
+    """
+    One output file per input. Batch runs write concurrently, so names must
+    never collide: `cleaned_<stem>.csv`, prefixed with the parent directory
+    when two inputs share a stem (x/a/train.csv, x/b/train.csv), and with an
+    index if that still isn't unique.
+    """
+    if len(input_csvs) == 1:
+        return {input_csvs[0]: OUTPUT_CSV}
+
+    def stem(path):
+        return os.path.splitext(os.path.basename(path))[0]
+
+    stems = [stem(p) for p in input_csvs]
+    names = [
+        f"{os.path.basename(os.path.dirname(p))}_{s}" if stems.count(s) > 1 else s
+        for p, s in zip(input_csvs, stems)
+    ]
+    names = [
+        f"{n}_{i}" if names.count(n) > 1 else n
+        for i, n in enumerate(names)
+    ]
+    if len(set(names)) < len(names):
+        sys.exit("❌ Could not give every input a distinct output file name.")
+    return {
+        path: os.path.join(OUTPUT_DIR, f"cleaned_{name}.csv")
+        for path, name in zip(input_csvs, names)
+    }
+
+
+OUTPUT_PATHS = _output_paths(INPUT_CSVS)
+
+
+def output_path_for(input_csv: str) -> str:
+    return OUTPUT_PATHS[input_csv]
+
+
+async def run_one(graph, input_csv: str, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        return await graph.ainvoke({
+            "raw_csv_path":           input_csv,
+            "output_csv_path":        output_path_for(input_csv),
+            "data_profile":           {},
+            "cleaning_plan":          "",
+            "generated_code":         "",
+            "error":                  None,
+            "cleaned_csv_path":       None,
+            "feature_engineering_draft": "",
+            "feature_engineering_plan": "",
+            "retry_count":            0,
+            "max_retries":            MAX_RETRIES,
+        })
+
+
+async def run_all(input_csvs: list) -> list:
+    """
+    Runs are independent (all per-run state lives in GraphState), so they
+    share one compiled graph and overlap their LLM round trips on one loop.
+    A failing file is returned as its exception instead of aborting the rest.
+    """
+    graph = build_graph(simple_mode=SIMPLE_MODE)
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_RUNS)
+    return await asyncio.gather(
+        *(run_one(graph, path, semaphore) for path in input_csvs),
+        return_exceptions=True,
+    )
 
-os.makedirs(os.path.dirname(OUTPUT_CSV), exist_ok=True)
 
 # ── Run ───────────────────────────────────────────────────────────────────────
 if __name__ == "__main__":
     print(f"\n🚀 Starting Data Cleaning Agent")
-    print(f"   Input  : {INPUT_CSV}")
-    print(f"   Output : {OUTPUT_CSV}\n")
-
-    graph = build_graph()
-
-    final_state = graph.invoke({
-        "raw_csv_path":           INPUT_CSV,
-        "output_csv_path":        OUTPUT_CSV,
-        "data_profile":           {},
-        "cleaning_plan":          "",
-        "generated_code":         "",
-        "error":                  None,
-        "cleaned_csv_path":       None,
-        "feature_engineering_plan": "",
-    })
+    for path in INPUT_CSVS:
+        print(f"   Input  : {path}")
+        print(f"   Output : {output_path_for(path)}")
+    print()
+
+    results = asyncio.run(run_all(INPUT_CSVS))
 
     print("\n" + "═" * 60)
     print("✅ Pipeline Complete!")
     print("═" * 60)
-    print(f"\n📁 Cleaned CSV saved to:\n   {final_state.get('cleaned_csv_path', 'N/A')}")
-    print(f"\n📊 Feature Engineering Plan:\n")
-    print(final_state.get("feature_engineering_plan", "N/A"))
+    print(
+        f"\n🗄️  Prompt tokens served from provider cache: "
+        f"{token_usage['cache_read_input_tokens']:,} / {token_usage['input_tokens']:,}"
+        f" (excludes {token_usage['unmetered_calls']} streamed call(s) closed early,"
+        " whose usage the provider never reports)"
+    )
+
+    if len(INPUT_CSVS) == 1:
+        final_state = results[0]
+        if isinstance(final_state, BaseException):
+            raise final_state
+        print(f"\n📁 Cleaned CSV saved to:\n   {final_state.get('cleaned_csv_path', 'N/A')}")
+        print(f"\n📊 Feature Engineering Plan:\n")
+        print(final_state.get("feature_engineering_plan") or "No feature engineering plan available.")
+    else:
+        for path, final_state in zip(INPUT_CSVS, results):
+            if isinstance(final_state, BaseException):
+                print(f"❌ {path}: {type(final_state).__name__}: {final_state}")
+            elif final_state.get("cleaned_csv_path"):
+                print(f"✅ {path} → {final_state['cleaned_csv_path']}")
+            else:
+                print(f"💀 {path}: gave up after {final_state['retry_count']} retries")